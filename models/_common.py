@@ -0,0 +1,155 @@
+"""
+INSIGMAAI 各模型适配器共用的工具函数
+"""
+
+import math
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from typing import Any, Optional
+
+from dify_plugin.errors.model import CredentialsValidateFailedError
+
+# endpoint 末尾可能携带的版本路径，按此顺序依次移除（与原先的 removesuffix 链一致）
+_VERSION_SUFFIXES = ("/v1", "/v1/", "/v1-openai", "/v1-openai/", "/openai-v1", "/openai-v1/")
+
+# 并发验证凭证时的最大线程数，避免同时向同一 endpoint 发起过多请求
+_VALIDATE_MAX_WORKERS = 8
+
+
+def validate_many(models: list[tuple[Any, str, dict]]) -> None:
+    """
+    并发验证多个模型适配器的凭证
+
+    说明：
+    - 供需要一次验证多个模型的批量入口使用；插件运行时逐个调用 validate_credentials，
+      目前插件内没有调用方
+    - 各适配器的 validate_credentials 均为相互独立的阻塞 HTTP 请求（I/O 密集型）
+    - 使用线程池并发执行，总耗时由 N × 单次延迟 降为约 1 × 单次延迟
+    - 只有一个待验证项时直接同步调用，不创建线程池
+
+    参数:
+        models (list[tuple]): (适配器实例, 模型名称, 凭证) 三元组列表
+
+    抛出:
+        CredentialsValidateFailedError: 任一验证失败时抛出（最先完成的失败项），
+            非凭证类异常会被包装为该异常，原异常保留在 __cause__ 中
+    """
+    if not models:
+        return
+
+    if len(models) == 1:
+        adapter, model, credentials = models[0]
+        _validate_one(adapter, model, credentials)
+        return
+
+    executor = ThreadPoolExecutor(max_workers=min(_VALIDATE_MAX_WORKERS, len(models)))
+    try:
+        futures = [
+            executor.submit(_validate_one, adapter, model, credentials)
+            for adapter, model, credentials in models
+        ]
+        for future in as_completed(futures):
+            # 任一验证失败时直接抛出其异常
+            future.result()
+    finally:
+        # 出现失败时取消尚未开始的验证任务
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _validate_one(adapter: Any, model: str, credentials: dict) -> None:
+    """
+    验证单个适配器的凭证，统一以 CredentialsValidateFailedError 报告失败
+    """
+    try:
+        adapter.validate_credentials(model, credentials)
+    except CredentialsValidateFailedError:
+        raise
+    except Exception as ex:
+        raise CredentialsValidateFailedError(f"[{model}] {ex}") from ex
+
+
+@lru_cache(maxsize=128)
+def normalize_base_url(url: str) -> str:
+    """
+    清理 endpoint URL，去除末尾斜杠及可能的版本路径
+
+    参数:
+        url (str): 用户配置的原始 endpoint_url
+
+    返回:
+        str: 不带版本路径和末尾斜杠的基础 URL
+
+    示例：
+        输入: "https://api.insigma.ai/v1-openai/"
+        输出: "https://api.insigma.ai"
+
+        输入: "https://api.insigma.ai/v1-openai/v1"
+        输出: "https://api.insigma.ai"
+    """
+    url = url.rstrip("/")
+    # 各后缀依次尝试移除，叠加的版本路径（如 /v1-openai/v1）也能全部去除
+    for suffix in _VERSION_SUFFIXES:
+        url = url.removesuffix(suffix)
+    return url
+
+
+@lru_cache(maxsize=128)
+def normalize_endpoint(raw_url: str) -> str:
+    """
+    将原始 endpoint_url 标准化为 OpenAI 兼容路径：{base_url}/v1
+
+    说明：
+    - 同一插件实例中 endpoint_url 几乎总是相同，结果按原始 URL 缓存
+    - 每次调用仅需一次字典查找，无需重复清理字符串
+
+    参数:
+        raw_url (str): 用户配置的原始 endpoint_url
+
+    返回:
+        str: 标准化后的 endpoint_url
+
+    示例：
+        输入: "https://api.insigma.ai/v1-openai"
+        输出: "https://api.insigma.ai/v1"
+    """
+    return f"{normalize_base_url(raw_url)}/v1"
+
+
+@lru_cache(maxsize=64)
+def auth_headers(api_key: Optional[str]) -> tuple[tuple[str, str], ...]:
+    """
+    构造 Bearer Token 认证请求头，按 api_key 缓存
+
+    说明：
+    - 返回不可变的 (名称, 值) 元组，可直接作为 httpx 的 headers 参数，无需每次重建字典
+    - 未配置 api_key 时返回空元组（不发送 Authorization）
+
+    参数:
+        api_key (str, optional): 凭证中的 API Key
+
+    返回:
+        tuple: 请求头键值对
+    """
+    if not api_key:
+        return ()
+    return (("Authorization", f"Bearer {api_key}"),)
+
+
+def parse_number(value: object, cast: Callable[[str], float], default: float) -> float:
+    """
+    解析凭证中用户填写的数值配置，为空、格式错误或非有限数时返回默认值
+
+    参数:
+        value (object): 凭证中的原始值（通常为字符串）
+        cast (Callable): 转换函数，如 int、float
+        default (float): 无法解析时返回的默认值
+
+    返回:
+        float: 解析后的数值
+    """
+    try:
+        number = cast(str(value).strip()) if value not in (None, "") else default
+    except ValueError:
+        return default
+    return number if math.isfinite(number) else default
@@ -0,0 +1,128 @@
+"""
+INSIGMAAI 各模型适配器共用的 HTTP 客户端
+
+说明：
+- 进程内共享一个 httpx.Client（HTTP/2 + keep-alive 连接池）
+- 对同一 endpoint 的重复调用复用已建立的 TLS 连接，HTTP/2 下独立请求可在同一连接上多路复用
+- httpx.Client 是线程安全的，可在多个请求间并发使用
+- 异步客户端的连接绑定在所在的事件循环上，不做进程级共享：各适配器的 _ainvoke 可接收调用方
+  持有的 httpx.AsyncClient，未传入时在本次调用内创建并在结束时关闭
+"""
+
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Optional
+
+import httpx
+from dify_plugin.errors.model import InvokeConnectionError, InvokeError, InvokeServerUnavailableError
+
+from models._common import auth_headers
+
+# 传入自定义 transport 时，连接池与 HTTP/2 配置需设置在 transport 上
+# 共享客户端与各预绑定客户端共用同一个 transport，即共用同一个连接池
+_SHARED_TRANSPORT = httpx.HTTPTransport(
+    http2=True,
+    retries=1,  # 仅对建立连接失败重试一次
+    limits=httpx.Limits(max_keepalive_connections=64, max_connections=128),
+)
+
+SHARED_CLIENT = httpx.Client(timeout=30, transport=_SHARED_TRANSPORT)
+
+
+
+def get_client() -> httpx.Client:
+    """
+    获取进程内共享的 HTTP 客户端
+
+    返回:
+        httpx.Client: 共享客户端实例
+    """
+    return SHARED_CLIENT
+
+
+def create_async_client() -> httpx.AsyncClient:
+    """
+    创建异步 HTTP 客户端（HTTP/2 + keep-alive 连接池）
+
+    说明：
+    - 需要并发发起多次 _ainvoke 的调用方可自行创建一个客户端并传给各次调用，共用连接池：
+      async with create_async_client() as client: ...
+    - 客户端及其连接绑定在首次使用它的事件循环上，应在该事件循环结束前关闭
+
+    返回:
+        httpx.AsyncClient: 新的异步客户端实例，由调用方负责关闭
+    """
+    return httpx.AsyncClient(
+        http2=True,
+        timeout=30,
+        limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+    )
+
+
+@asynccontextmanager
+async def async_client_scope(client: Optional[httpx.AsyncClient] = None) -> AsyncIterator[httpx.AsyncClient]:
+    """
+    获取本次异步调用使用的 HTTP 客户端
+
+    说明：
+    - 传入调用方持有的客户端时直接使用，不负责关闭
+    - 未传入时创建临时客户端，退出上下文时关闭，不会在事件循环结束后遗留连接
+
+    参数:
+        client (httpx.AsyncClient, optional): 调用方持有的异步客户端
+
+    返回:
+        AsyncIterator[httpx.AsyncClient]: 本次调用使用的异步客户端
+    """
+    if client is not None:
+        yield client
+        return
+
+    async with create_async_client() as owned:
+        yield owned
+
+
+@lru_cache(maxsize=64)
+def get_bound_client(base_url: str, api_key: Optional[str]) -> httpx.Client:
+    """
+    获取预绑定 base_url 与认证请求头的 HTTP 客户端，按 (base_url, api_key) 缓存
+
+    说明：
+    - 部署后的插件中 endpoint 与 api_key 几乎不变，预先绑定后每次调用只需传入相对路径与请求体
+    - 省去每次调用的 URL 拼接解析与请求头构造；底层连接池与 SHARED_CLIENT 共用
+
+    参数:
+        base_url (str): 已标准化的基础 URL（不含版本路径）
+        api_key (str, optional): 凭证中的 API Key
+
+    返回:
+        httpx.Client: 预绑定的客户端实例
+    """
+    return httpx.Client(
+        base_url=base_url,
+        headers=auth_headers(api_key),
+        timeout=30,
+        transport=_SHARED_TRANSPORT,
+    )
+
+
+def with_httpx_errors(
+    mapping: dict[type[InvokeError], list[type[Exception]]],
+) -> dict[type[InvokeError], list[type[Exception]]]:
+    """
+    在父类异常映射表（requests 异常）基础上补充 httpx 异常，供改用 httpx 发送请求的适配器使用
+
+    参数:
+        mapping (dict): 父类的 _invoke_error_mapping
+
+    返回:
+        dict: 补充了 httpx 超时、连接与协议异常的映射表
+    """
+    mapping[InvokeConnectionError] = [*mapping[InvokeConnectionError], httpx.TimeoutException]
+    mapping[InvokeServerUnavailableError] = [
+        *mapping[InvokeServerUnavailableError],
+        httpx.ConnectError,
+        httpx.RemoteProtocolError,
+    ]
+    return mapping
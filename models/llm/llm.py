@@ -16,6 +16,8 @@ from dify_plugin.entities.model.llm import LLMMode, LLMResult
 from dify_plugin.entities.model.message import PromptMessage, PromptMessageTool
 from dify_plugin.errors.model import CredentialsValidateFailedError
 
+from models._common import normalize_endpoint
+
 import logging
 
 # 配置日志系统
@@ -200,20 +202,8 @@ class INSIGMAAILanguageModel(OAICompatLargeLanguageModel):
         返回:
             新的凭证副本，其中 endpoint_url 已标准化
         """
-        credentials = credentials.copy()  # 避免修改原对象
-        base_url = (
-            credentials["endpoint_url"]
-            .rstrip("/")                    # 去除末尾斜杠
-            .removesuffix("/v1")           # 移除可能的 /v1
-            .removesuffix("/v1/")
-            .removesuffix("/v1-openai")
-            .removesuffix("/v1-openai/")
-            .removesuffix("/openai-v1")
-            .removesuffix("/openai-v1/")
-        )
-        # 重新拼接标准路径
-        credentials["endpoint_url"] = f"{base_url}/v1"
-        return credentials
+        # 返回新的凭证副本（避免修改原对象），标准化结果按原始 URL 缓存
+        return {**credentials, "endpoint_url": normalize_endpoint(credentials["endpoint_url"])}
 
     def get_customizable_model_schema(self, model, credentials):
         """
@@ -1,7 +1,12 @@
-from json import dumps
+import hashlib
+import threading
+from collections import OrderedDict
+from collections.abc import Iterable, Iterator
 from typing import Optional
 from dify_plugin import RerankModel
 import httpx
+import ijson
+import orjson
 from dify_plugin.entities.model import (
     AIModelEntity,
     FetchFrom,
@@ -19,8 +24,83 @@ from dify_plugin.errors.model import (
     InvokeRateLimitError,
     InvokeServerUnavailableError,
 )
-from requests import post
-from yarl import URL
+from models._common import auth_headers, normalize_base_url
+from models._http import async_client_scope, get_bound_client
+
+# top_n 超过该值时以流式方式逐条解析响应，避免完整 JSON 字节与解析结果同时驻留内存
+_STREAM_TOP_N = 256
+
+
+class _RerankCache:
+    """
+    进程内重排序结果缓存（LRU）
+
+    说明：
+    - Agent 循环在重试、反思时经常对完全相同的 (query, docs) 重复重排序，命中缓存可直接省去整次请求
+    - 缓存键包含 endpoint、api_key、模型、查询、文档摘要（blake2b）、top_n 与分数阈值
+    - 同时限制条目数与缓存文档总数，避免长文档列表占用过多内存
+    - 条目以不可变的 (index, text, score) 元组保存，每次命中重新构造 RerankDocument，
+      调用方修改返回的文档不会影响缓存
+    """
+
+    def __init__(self, max_entries: int = 256, max_docs: int = 10000) -> None:
+        self._max_entries = max_entries
+        self._max_docs = max_docs
+        self._total_docs = 0
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[tuple, tuple[tuple[int, str, float], ...]] = OrderedDict()
+
+    @staticmethod
+    def make_key(
+        credentials: dict,
+        model: str,
+        query: str,
+        docs: list[str],
+        top_n: Optional[int],
+        score_threshold: Optional[float],
+    ) -> tuple:
+        """
+        构造缓存键，文档列表以 blake2b 摘要代替，避免键本身占用大量内存
+        """
+        digest = hashlib.blake2b(
+            b"\0".join(doc.encode() for doc in docs), digest_size=16
+        ).digest()
+        return (
+            credentials["endpoint_url"],
+            credentials.get("api_key"),
+            model,
+            query,
+            len(docs),
+            digest,
+            top_n,
+            score_threshold,
+        )
+
+    def get(self, key: tuple) -> Optional[list[RerankDocument]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+        return [RerankDocument(index=index, text=text, score=score) for index, text, score in entry]
+
+    def put(self, key: tuple, documents: list[RerankDocument]) -> None:
+        if len(documents) > self._max_docs:
+            return
+        entry = tuple((doc.index, doc.text, doc.score) for doc in documents)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._total_docs -= len(old)
+            self._entries[key] = entry
+            self._total_docs += len(entry)
+            # 超出条目数或文档总数上限时淘汰最久未使用的条目
+            while len(self._entries) > self._max_entries or self._total_docs > self._max_docs:
+                _, evicted = self._entries.popitem(last=False)
+                self._total_docs -= len(evicted)
+
+
+_CACHE = _RerankCache()
 
 
 class INSIGMAAIRerankModel(RerankModel):
@@ -46,6 +126,8 @@ class INSIGMAAIRerankModel(RerankModel):
         score_threshold: Optional[float] = None,
         top_n: Optional[int] = None,
         user: Optional[str] = None,
+        *,
+        use_cache: bool = True,
     ) -> RerankResult:
         """
         调用 INSIGMAAI 的重排序模型接口
@@ -58,6 +140,7 @@ class INSIGMAAIRerankModel(RerankModel):
             score_threshold (float, optional): 返回结果的最低相关性分数阈值
             top_n (int, optional): 返回前 N 个最相关的文档，默认为 3
             user (str, optional): 调用者唯一标识（可用于限流、审计等）
+            use_cache (bool): 是否使用进程内结果缓存，凭证验证时关闭以确保真正请求接口
 
         返回:
             RerankResult: 包含排序后文档及其分数的结果对象
@@ -69,80 +152,191 @@ class INSIGMAAIRerankModel(RerankModel):
         if len(docs) == 0:
             return RerankResult(model=model, docs=[])
 
-        # 默认返回前 3 个最相关文档
-        if top_n is None:
-            top_n = 3
-
         # 清理模型名（去除首尾空格）
         model = model.strip()
 
-        # 构建基础 endpoint URL，移除可能重复的版本路径（如 /v1, /v1-openai）
-        endpoint_url = (
-            credentials["endpoint_url"]
-            .rstrip("/")                  # 去除末尾斜杠
-            .removesuffix("/v1")           # 移除可能的 /v1
-            .removesuffix("/v1/")
-            .removesuffix("/v1-openai")
-            .removesuffix("/v1-openai/")
-            .removesuffix("/openai-v1")
-            .removesuffix("/openai-v1/")
-        )
+        # 相同请求命中缓存时直接返回，省去整次网络请求
+        cache_key = None
+        if use_cache:
+            cache_key = _CACHE.make_key(credentials, model, query, docs, top_n, score_threshold)
+            cached = _CACHE.get(cache_key)
+            if cached is not None:
+                return RerankResult(model=model, docs=cached)
 
-        # 设置请求头：Bearer Token 认证 + JSON 格式
-        headers = {
-            "Authorization": f"Bearer {credentials.get('api_key')}",
-            "Content-Type": "application/json",
-        }
+        data, timeout = self._build_request(model, credentials, query, docs, top_n)
 
-        # 构造请求体数据
-        data = {
-            "model": model,
-            "query": query,
-            "documents": docs,           # 支持纯文本文档列表
-            "top_n": top_n               # 限制返回数量
-        }
+        # 获取预绑定 endpoint 与认证请求头的客户端（按 endpoint + api_key 缓存）
+        client = get_bound_client(
+            normalize_base_url(credentials["endpoint_url"]), credentials.get("api_key")
+        )
 
         try:
-            # 从凭据中获取超时时间，未设置则默认 12 秒
-            timeout = float(credentials.get("timeout", 12))
-
-            # 发送 POST 请求到 /v1/rerank 接口
-            response = post(
-                str(URL(endpoint_url) / "v1" / "rerank"),
-                headers=headers,
-                data=dumps(data),         # 序列化为 JSON 字符串
-                timeout=timeout,
-            )
+            # 返回结果较多时改为流式解析
+            if data["top_n"] > _STREAM_TOP_N:
+                with client.stream("POST", "/v1/rerank", json=data, timeout=timeout) as response:
+                    response.raise_for_status()
+                    rerank_documents = self._build_documents(
+                        self._iter_results(response), docs, score_threshold
+                    )
+            else:
+                # 发送 POST 请求到 /v1/rerank 接口
+                response = client.post(
+                    "/v1/rerank",
+                    json=data,                # 由 httpx 直接序列化为 JSON
+                    timeout=timeout,
+                )
+
+                # 检查 HTTP 状态码，非 2xx 会抛出异常
+                response.raise_for_status()
+
+                # 解析响应 JSON：orjson 直接解析原始字节，省去 response.text 的解码过程
+                results = orjson.loads(response.content)
+                rerank_documents = self._build_documents(results["results"], docs, score_threshold)
+
+            if cache_key is not None:
+                _CACHE.put(cache_key, rerank_documents)
 
-            # 检查 HTTP 状态码，非 2xx 会抛出异常
-            response.raise_for_status()
+            # 返回最终结果
+            return RerankResult(model=model, docs=rerank_documents)
 
-            # 解析响应 JSON
-            results = response.json()
+        except httpx.HTTPStatusError as e:
+            # 显式捕获 HTTP 状态错误（如 5xx），转换为 Dify 统一异常
+            raise InvokeServerUnavailableError(str(e))
 
-            # 构建重排序后的文档列表
-            rerank_documents = []
-            for result in results["results"]:
-                index = result["index"]   # 原始文档索引
-                # 优先使用返回中的 document.text，否则使用原始 docs 中的内容
-                text = result["document"]["text"] if "document" in result else docs[index]
-                score = result["relevance_score"]
+        # 其他异常由 _invoke_error_mapping 映射处理（见下方）
 
-                # 创建重排序文档对象
-                rerank_document = RerankDocument(index=index, text=text, score=score)
+    async def _ainvoke(
+        self,
+        model: str,
+        credentials: dict,
+        query: str,
+        docs: list[str],
+        score_threshold: Optional[float] = None,
+        top_n: Optional[int] = None,
+        user: Optional[str] = None,
+        *,
+        use_cache: bool = True,
+        client: Optional[httpx.AsyncClient] = None,
+    ) -> RerankResult:
+        """
+        _invoke 的异步版本，供在事件循环中并发执行多组重排序的调用方使用
 
-                # 若设置了分数阈值，则过滤低于阈值的结果
-                if score_threshold is None or score >= score_threshold:
-                    rerank_documents.append(rerank_document)
+        说明：
+        - 参数、返回值、异常及结果缓存均与 _invoke 一致
+        - client 为调用方持有的 httpx.AsyncClient（见 create_async_client），并发调用时传入同一个
+          客户端即可复用连接（HTTP/2 多路传输）；未传入时本次调用内创建并关闭临时客户端
+        - AsyncClient 绑定所在的事件循环，因此同步的 _invoke 仍走共享的同步客户端，
+          而不是对每次调用 asyncio.run(self._ainvoke(...))
+        """
+        if len(docs) == 0:
+            return RerankResult(model=model, docs=[])
 
-            # 返回最终结果
+        model = model.strip()
+
+        cache_key = None
+        if use_cache:
+            cache_key = _CACHE.make_key(credentials, model, query, docs, top_n, score_threshold)
+            cached = _CACHE.get(cache_key)
+            if cached is not None:
+                return RerankResult(model=model, docs=cached)
+
+        data, timeout = self._build_request(model, credentials, query, docs, top_n)
+        url = f"{normalize_base_url(credentials['endpoint_url'])}/v1/rerank"
+        headers = auth_headers(credentials.get("api_key"))
+
+        try:
+            async with async_client_scope(client) as http:
+                response = await http.post(url, headers=headers, json=data, timeout=timeout)
+            response.raise_for_status()
+            results = orjson.loads(response.content)
+            rerank_documents = self._build_documents(results["results"], docs, score_threshold)
+            if cache_key is not None:
+                _CACHE.put(cache_key, rerank_documents)
             return RerankResult(model=model, docs=rerank_documents)
 
         except httpx.HTTPStatusError as e:
-            # 显式捕获 HTTP 状态错误（如 5xx），转换为 Dify 统一异常
             raise InvokeServerUnavailableError(str(e))
 
-        # 其他异常由 _invoke_error_mapping 映射处理（见下方）
+    @staticmethod
+    def _build_request(
+        model: str,
+        credentials: dict,
+        query: str,
+        docs: list[str],
+        top_n: Optional[int],
+    ) -> tuple[dict, float]:
+        """
+        构造 /v1/rerank 请求所需的请求体与超时时间
+
+        返回:
+            tuple: (data, timeout)
+        """
+        # 默认返回前 3 个最相关文档
+        if top_n is None:
+            top_n = 3
+
+        # 构造请求体数据
+        data = {
+            "model": model,
+            "query": query,
+            "documents": docs,           # 支持纯文本文档列表
+            "top_n": top_n               # 限制返回数量
+        }
+
+        # 从凭据中获取超时时间，未设置则默认 12 秒
+        timeout = float(credentials.get("timeout", 12))
+
+        return data, timeout
+
+    @staticmethod
+    def _iter_results(response: httpx.Response) -> Iterator[dict]:
+        """
+        边接收响应边解析 results 数组，逐条产出结果对象
+
+        说明：
+        - 使用 ijson 的推送式解析器，每收到一块数据就解析出已完整的结果项
+        - 解析器额外占用的内存为常数级，不随 results 数量增长
+        """
+        items = ijson.sendable_list()
+        parser = ijson.items_coro(items, "results.item", use_float=True)
+        for chunk in response.iter_bytes():
+            parser.send(chunk)
+            yield from items
+            del items[:]
+        parser.close()
+        yield from items
+
+    @staticmethod
+    def _build_documents(
+        results: Iterable[dict], docs: list[str], score_threshold: Optional[float]
+    ) -> list[RerankDocument]:
+        """
+        根据接口返回的 results 列表构建重排序后的文档列表
+
+        说明：
+        - 优先使用返回中的 document.text，否则使用原始 docs 中的内容（按原始文档索引）
+        - 阈值判断提到循环外，避免每个结果都分支一次
+        """
+        if score_threshold is None:
+            return [
+                RerankDocument(
+                    index=r["index"],
+                    text=r["document"]["text"] if "document" in r else docs[r["index"]],
+                    score=r["relevance_score"],
+                )
+                for r in results
+            ]
+
+        # 若设置了分数阈值，则过滤低于阈值的结果
+        return [
+            RerankDocument(
+                index=r["index"],
+                text=r["document"]["text"] if "document" in r else docs[r["index"]],
+                score=r["relevance_score"],
+            )
+            for r in results
+            if r["relevance_score"] >= score_threshold
+        ]
 
     def validate_credentials(self, model: str, credentials: dict) -> None:
         """
@@ -171,6 +365,7 @@ class INSIGMAAIRerankModel(RerankModel):
                     "上海市是中国的经济、金融、贸易和航运中心，位于中国东部沿海，是重要的国际化大都市，但并非首都。",
                 ],
                 score_threshold=0.8,
+                use_cache=False,
             )
         except Exception as ex:
             # 将任何异常转换为凭证验证失败错误
@@ -183,13 +378,16 @@ class INSIGMAAIRerankModel(RerankModel):
 
         说明：
         - 此映射用于自动转换异常类型，便于上层统一处理
+        - 父类按顺序匹配，命中第一个即返回，因此具体异常需排在宽泛异常之前
+        - 超时与语音适配器（with_httpx_errors）一致，映射为连接错误
         - 空列表表示该错误类型需在 _invoke 中手动处理
 
         返回:
             dict: 异常映射关系
         """
         return {
-            InvokeConnectionError: [httpx.ConnectError],           # 连接失败
+            # 连接失败与超时（含读取/连接池超时），需先于下方宽泛的 RequestError 匹配
+            InvokeConnectionError: [httpx.ConnectError, httpx.TimeoutException],
             InvokeServerUnavailableError: [httpx.RemoteProtocolError],  # 协议错误（可视为服务不可用）
             InvokeRateLimitError: [],                             # 暂无自动映射，需手动处理
             InvokeAuthorizationError: [httpx.HTTPStatusError],    # HTTP 状态错误（如 401）映射为授权错误
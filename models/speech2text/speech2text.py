@@ -1,12 +1,22 @@
-from typing import Optional, IO
+from typing import Any, Optional, IO
+from urllib.parse import urljoin
 import logging
 
+import httpx
+import orjson
 from dify_plugin import OAICompatSpeech2TextModel
 from dify_plugin.entities.model import AIModelEntity, FetchFrom, I18nObject, ModelType
+from dify_plugin.errors.model import InvokeBadRequestError, InvokeError
+
+from models._common import auth_headers, normalize_endpoint
+from models._http import async_client_scope, get_client, with_httpx_errors
 
 # 创建专用 logger
 logger = logging.getLogger(__name__)
 
+# 上传超时：连接 10 秒，读写 300 秒（大音频文件上传与识别耗时较长）
+_UPLOAD_TIMEOUT = httpx.Timeout(300, connect=10)
+
 
 class INSIGMAAISpeechToTextModel(OAICompatSpeech2TextModel):
     """
@@ -33,51 +43,140 @@ class INSIGMAAISpeechToTextModel(OAICompatSpeech2TextModel):
         执行语音转文本任务，并记录调用日志
         """
         model = model.strip()
+        # 使用 %s 占位符延迟格式化，日志级别被过滤时不产生字符串拼接开销
         logger.info(
-            f"[Speech2Text._invoke] 开始调用模型: {model}, 用户: {user or 'unknown'}, "
-            f"文件对象类型: {type(file).__name__}"
+            "[Speech2Text._invoke] 开始调用模型: %s, 用户: %s, 文件对象类型: %s",
+            model, user or "unknown", type(file).__name__,
         )
 
         try:
-            # ✅ 添加：重置文件指针
-            file.seek(0)
+            self._rewind(file)
             # 标准化凭证
             compatible_credentials = self._standardize_endpoint_url(credentials)
             endpoint = compatible_credentials["endpoint_url"]
-            logger.debug(f"[Speech2Text._invoke] 使用标准化 endpoint: {endpoint}")
+            logger.debug("[Speech2Text._invoke] 使用标准化 endpoint: %s", endpoint)
 
-            # 调用父类实现（实际发送请求）
-            result = super()._invoke(model, compatible_credentials, file)
-            logger.info(f"[Speech2Text._invoke] 模型调用成功，返回文本长度: {len(result)}")
+            # 发送转写请求（流式上传音频文件）
+            result = self._transcribe(model, compatible_credentials, file)
+            logger.info("[Speech2Text._invoke] 模型调用成功，返回文本长度: %d", len(result))
             return result
 
         except Exception as e:
             logger.error(
-                f"[Speech2Text._invoke] 模型调用失败，模型: {model}, 错误: {str(e)}",
+                "[Speech2Text._invoke] 模型调用失败，模型: %s, 错误: %s", model, e,
                 exc_info=True  # 记录完整堆栈
             )
             raise
 
-    def validate_credentials(self, model: str, credentials: dict) -> None:
+    async def _ainvoke(
+        self,
+        model: str,
+        credentials: dict,
+        file: IO[bytes],
+        user: Optional[str] = None,
+        *,
+        client: Optional[httpx.AsyncClient] = None,
+    ) -> str:
         """
-        验证模型凭证是否有效，并记录验证过程日志
+        _invoke 的异步版本，通过 httpx.AsyncClient 上传音频
+
+        说明：
+        - 当前 dify_plugin 运行时仍同步调用 _invoke；此方法供在事件循环中并发调用的场景使用，
+          无需为每个调用占用一个线程
+        - client 为调用方持有的异步客户端，多个转写请求传入同一个客户端即可复用连接池；
+          未传入时本次调用内创建并关闭临时客户端
+        - 其余参数、返回值与异常均与 _invoke 一致
         """
+        model = model.strip()
         logger.info(
-            f"[Speech2Text.validate_credentials] 开始验证凭证，模型: {model}"
+            "[Speech2Text._ainvoke] 开始调用模型: %s, 用户: %s, 文件对象类型: %s",
+            model, user or "unknown", type(file).__name__,
         )
 
+        try:
+            self._rewind(file)
+            compatible_credentials = self._standardize_endpoint_url(credentials)
+            request = self._build_transcription_request(model, compatible_credentials, file)
+            async with async_client_scope(client) as http:
+                result = self._parse_transcription(await http.post(**request))
+            logger.info("[Speech2Text._ainvoke] 模型调用成功，返回文本长度: %d", len(result))
+            return result
+
+        except Exception as e:
+            logger.error(
+                "[Speech2Text._ainvoke] 模型调用失败，模型: %s, 错误: %s", model, e,
+                exc_info=True
+            )
+            raise
+
+    @staticmethod
+    def _rewind(file: IO[bytes]) -> None:
+        """
+        仅在文件指针不在开头时重置，避免不必要的 seek
+        """
+        try:
+            if file.tell() != 0:
+                file.seek(0)
+        except (OSError, AttributeError):
+            # 不可定位的流（如管道）直接从当前位置读取
+            pass
+
+    def _transcribe(self, model: str, credentials: dict, file: IO[bytes]) -> str:
+        """
+        调用 /v1/audio/transcriptions 接口完成转写
+
+        说明：
+        - 请求格式与父类一致（multipart：model 字段 + file 文件）
+        - 父类使用 requests 的 files= 上传，会先把整个 multipart 请求体拼接到内存；
+          这里改用 httpx 按块读取文件对象边读边发，峰值内存不随音频大小增长
+        """
+        request = self._build_transcription_request(model, credentials, file)
+        return self._parse_transcription(get_client().post(**request))
+
+    @staticmethod
+    def _build_transcription_request(model: str, credentials: dict, file: IO[bytes]) -> dict[str, Any]:
+        """
+        构造转写请求参数，_transcribe 与 _ainvoke 共用，保证同步与异步请求一致
+
+        返回:
+            dict: 可直接传给 httpx 客户端 post() 的关键字参数
+        """
+        return {
+            "url": urljoin(credentials["endpoint_url"] + "/", "audio/transcriptions"),
+            "headers": auth_headers(credentials.get("api_key")),
+            "data": {"model": model},
+            "files": {"file": file},
+            "timeout": _UPLOAD_TIMEOUT,
+        }
+
+    @staticmethod
+    def _parse_transcription(response: httpx.Response) -> str:
+        """
+        检查转写响应状态并提取识别文本
+        """
+        if response.status_code != 200:
+            raise InvokeBadRequestError(response.text)
+        # orjson 直接解析原始字节，省去 response.text 的解码过程
+        return orjson.loads(response.content)["text"]
+
+    def validate_credentials(self, model: str, credentials: dict) -> None:
+        """
+        验证模型凭证是否有效，并记录验证过程日志
+        """
+        logger.info("[Speech2Text.validate_credentials] 开始验证凭证，模型: %s", model)
+
         try:
             compatible_credentials = self._standardize_endpoint_url(credentials)
             endpoint = compatible_credentials["endpoint_url"]
-            logger.debug(f"[Speech2Text.validate_credentials] 标准化 endpoint: {endpoint}")
+            logger.debug("[Speech2Text.validate_credentials] 标准化 endpoint: %s", endpoint)
 
             # 调用父类验证逻辑
             super().validate_credentials(model, compatible_credentials)
-            logger.info(f"[Speech2Text.validate_credentials] 凭证验证成功: {model}")
+            logger.info("[Speech2Text.validate_credentials] 凭证验证成功: %s", model)
 
         except Exception as e:
             logger.error(
-                f"[Speech2Text.validate_credentials] 凭证验证失败，模型: {model}, 错误: {str(e)}",
+                "[Speech2Text.validate_credentials] 凭证验证失败，模型: %s, 错误: %s", model, e,
                 exc_info=True
             )
             raise
@@ -86,36 +185,21 @@ class INSIGMAAISpeechToTextModel(OAICompatSpeech2TextModel):
         """
         标准化模型调用凭证，确保 endpoint_url 格式统一，并记录处理过程
         """
-        credentials = credentials.copy()
-        # original_url = credentials["endpoint_url"]
-
-        # 清理并标准化 URL
-        base_url = (
-            credentials["endpoint_url"]
-            .rstrip("/")                    # 去除末尾斜杠
-            .removesuffix("/v1")           # 移除可能的 /v1
-            .removesuffix("/v1/")
-            .removesuffix("/v1-openai")
-            .removesuffix("/v1-openai/")
-            .removesuffix("/openai-v1")
-            .removesuffix("/openai-v1/")
-        )
-        credentials["endpoint_url"] = f"{base_url}/v1"
-
-        # logger.debug(
-        #     f"[Speech2Text._standardize_endpoint_url] "
-        #     f"标准化 endpoint: '{original_url}' -> '{credentials['endpoint_url']}'"
-        # )
+        # 复制凭证并覆盖 endpoint_url（标准化结果按原始 URL 缓存）
+        return {**credentials, "endpoint_url": normalize_endpoint(credentials["endpoint_url"])}
 
-        return credentials
+    @property
+    def _invoke_error_mapping(self) -> dict[type[InvokeError], list[type[Exception]]]:
+        """
+        异常映射表：在父类（requests 异常）基础上补充 _transcribe 使用的 httpx 异常
+        """
+        return with_httpx_errors(super()._invoke_error_mapping)
 
     def get_customizable_model_schema(self, model: str, credentials: dict) -> Optional[AIModelEntity]:
         """
         定义模型元数据（Schema），记录初始化信息
         """
-        logger.debug(
-            f"[Speech2Text.get_customizable_model_schema] 生成模型元数据，模型: {model}"
-        )
+        logger.debug("[Speech2Text.get_customizable_model_schema] 生成模型元数据，模型: %s", model)
 
         entity = AIModelEntity(
             model=model,
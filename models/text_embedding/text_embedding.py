@@ -1,12 +1,92 @@
-from typing import Optional
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Optional
 
 # Dify 插件基类与实体
 from dify_plugin import OAICompatEmbeddingModel
-from dify_plugin.entities.model import EmbeddingInputType
+from dify_plugin.entities.model import AIModelEntity, EmbeddingInputType, ModelPropertyKey
 from dify_plugin.entities.model.text_embedding import TextEmbeddingResult
 
-# 工具库：用于 URL 处理（更安全的解析）
-from yarl import URL
+from models._common import normalize_endpoint, parse_number
+
+
+class _BatchingEmbedder:
+    """
+    文本向量化请求合并器（微批处理）
+
+    说明：
+    - 入库流程中 Dify 往往对每个文档单独调用一次 _invoke
+    - 同一批次键（模型 + 凭证 + 输入类型）下，在合并窗口内到达的调用会合并为一次 HTTP 请求，
+      充分利用服务端的 GPU 批处理能力，再按各调用方的下标区间拆分结果
+    - 窗口内第一个到达的调用方负责等待窗口结束并发送请求，其余调用方等待其结果
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._pending: dict[tuple, list[tuple[list[str], Future]]] = {}
+
+    def embed(
+        self,
+        key: tuple,
+        texts: list[str],
+        window: float,
+        flush: Callable[[list[str]], TextEmbeddingResult],
+    ) -> tuple[TextEmbeddingResult, int, int]:
+        """
+        提交一组文本，等待所在批次完成
+
+        参数:
+            key (tuple): 批次键，只有键相同的调用才会合并
+            texts (list[str]): 本次调用的文本列表
+            window (float): 合并窗口（秒）
+            flush (Callable): 发送合并后请求的函数
+
+        返回:
+            tuple: (合并请求的结果, 本次调用在结果中的起始下标, 结束下标)
+        """
+        future: Future = Future()
+        with self._lock:
+            batch = self._pending.get(key)
+            is_leader = batch is None
+            if is_leader:
+                batch = self._pending[key] = []
+            batch.append((texts, future))
+
+        if is_leader:
+            # 等待窗口结束，收集期间到达的同批次调用
+            time.sleep(window)
+            with self._lock:
+                batch = self._pending.pop(key)
+            self._flush(batch, flush)
+
+        return future.result()
+
+    @staticmethod
+    def _flush(
+        batch: list[tuple[list[str], Future]],
+        flush: Callable[[list[str]], TextEmbeddingResult],
+    ) -> None:
+        """
+        合并批次内所有文本发送一次请求，并把结果区间分发给各调用方
+        """
+        try:
+            result = flush([text for texts, _ in batch for text in texts])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        offset = 0
+        for texts, future in batch:
+            future.set_result((result, offset, offset + len(texts)))
+            offset += len(texts)
+
+
+_BATCHER = _BatchingEmbedder()
+
+# 合并窗口上限（毫秒）：窗口内首个调用方会阻塞等待整个窗口，过大的配置会拖慢每次入库调用
+_MAX_BATCH_WINDOW_MS = 100
 
 
 class INSIGMAAITextEmbeddingModel(OAICompatEmbeddingModel):
@@ -56,6 +136,18 @@ class INSIGMAAITextEmbeddingModel(OAICompatEmbeddingModel):
         # 标准化 endpoint，确保兼容 OpenAI 风格 API
         compatible_credentials = self._get_compatible_credentials(credentials)
 
+        # 可选：在合并窗口内把多次调用合并为一次请求（默认关闭）
+        # 父类按 max_chunks 拆分请求，max_chunks 为 1 时合并无法减少请求数，只会增加等待，因此不合并
+        window_ms = min(parse_number(credentials.get("batch_window_ms"), float, 0), _MAX_BATCH_WINDOW_MS)
+        if (
+            window_ms > 0
+            and texts
+            and self._get_max_chunks(model, compatible_credentials) > 1
+        ):
+            return self._invoke_batched(
+                model, compatible_credentials, texts, user, input_type, window_ms / 1000
+            )
+
         # 调用父类实现（发送请求、处理响应、返回 Embedding 结果）
         return super()._invoke(
             model=model,
@@ -65,6 +157,65 @@ class INSIGMAAITextEmbeddingModel(OAICompatEmbeddingModel):
             input_type=input_type
         )
 
+    def _invoke_batched(
+        self,
+        model: str,
+        credentials: dict,
+        texts: list[str],
+        user: Optional[str],
+        input_type: EmbeddingInputType,
+        window: float,
+    ) -> TextEmbeddingResult:
+        """
+        通过合并器发送向量化请求，并从合并结果中取出本次调用对应的部分
+
+        说明：
+        - 只有模型、凭证、输入类型、用户完全相同的调用才会合并
+        - 合并后的文本由父类按 max_chunks 分块发送，每块一次请求
+        - token 用量按本次调用文本数量占整批文本数量的比例分摊
+        """
+        key = (
+            model,
+            input_type,
+            user,
+            tuple(sorted((k, str(v)) for k, v in credentials.items())),
+        )
+
+        def flush(all_texts: list[str]) -> TextEmbeddingResult:
+            return super(INSIGMAAITextEmbeddingModel, self)._invoke(
+                model=model,
+                credentials=credentials,
+                texts=all_texts,
+                user=user,
+                input_type=input_type,
+            )
+
+        result, start, end = _BATCHER.embed(key, texts, window, flush)
+        if start == 0 and end == len(result.embeddings):
+            return result
+
+        # 按文本数量分摊整批的 token 用量
+        tokens = round(result.usage.tokens * (end - start) / len(result.embeddings))
+
+        return TextEmbeddingResult(
+            model=result.model,
+            embeddings=result.embeddings[start:end],
+            usage=self._calc_response_usage(model=model, credentials=credentials, tokens=tokens),
+        )
+
+    def get_customizable_model_schema(self, model: str, credentials: dict) -> AIModelEntity:
+        """
+        生成模型元数据，在父类基础上支持通过凭证配置 max_chunks
+
+        说明：
+        - 父类固定 max_chunks 为 1，即每个文本单独发送一次请求
+        - max_chunks 决定单次请求最多携带的文本数，也是请求合并（batch_window_ms）生效的前提
+        """
+        entity = super().get_customizable_model_schema(model, credentials)
+        max_chunks = int(parse_number(credentials.get("max_chunks"), int, 1))
+        entity.model_properties[ModelPropertyKey.MAX_CHUNKS] = max(max_chunks, 1)
+        return entity
+
     def validate_credentials(self, model: str, credentials: dict) -> None:
         """
         验证模型凭证是否有效
@@ -106,25 +257,6 @@ class INSIGMAAITextEmbeddingModel(OAICompatEmbeddingModel):
             输入: "https://api.insigma.ai/v1-openai"
             输出: "https://api.insigma.ai/v1"
         """
-        # 防止修改原始对象
-        credentials = credentials.copy()
-
-        # 提取原始 URL
-        original_url = credentials["endpoint_url"]
-
-        # 使用字符串操作清理末尾路径
-        base_url = (
-            original_url
-            .rstrip("/")                  # 去除末尾斜杠
-            .removesuffix("/v1")           # 移除可能的 /v1
-            .removesuffix("/v1/")
-            .removesuffix("/v1-openai")
-            .removesuffix("/v1-openai/")
-            .removesuffix("/openai-v1")
-            .removesuffix("/openai-v1/")
-        )
-
-        # 强制统一为 /v1 路径（OpenAI 兼容接口）
-        credentials["endpoint_url"] = f"{base_url}/v1"
-
-        return credentials
\ No newline at end of file
+        # 返回新的凭证副本（防止修改原始对象），endpoint_url 强制统一为 /v1 路径
+        # 标准化结果按原始 URL 缓存，避免每次调用重复清理字符串
+        return {**credentials, "endpoint_url": normalize_endpoint(credentials["endpoint_url"])}
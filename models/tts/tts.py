@@ -1,8 +1,21 @@
-from typing import Any, Optional
+from collections.abc import AsyncGenerator, Generator
+from typing import Optional
+
+import httpx
 
 # 使用 Dify 提供的 OpenAI 兼容 TTS 基类
+from dify_plugin.errors.model import InvokeBadRequestError, InvokeError
 from dify_plugin.interfaces.model.openai_compatible.tts import OAICompatText2SpeechModel
 
+from models._common import auth_headers, normalize_endpoint, parse_number
+from models._http import async_client_scope, get_client, with_httpx_errors
+
+# 流式返回音频时每块的字节数（与父类一致）
+_CHUNK_SIZE = 4096
+
+# 单句合成的默认读取超时（秒）：长句合成到首字节可能较久，不能沿用共享客户端的 30 秒
+_DEFAULT_SPEECH_TIMEOUT = 300
+
 
 class INSIGMAAITextToSpeechModel(OAICompatText2SpeechModel):
     """
@@ -19,8 +32,8 @@ class INSIGMAAITextToSpeechModel(OAICompatText2SpeechModel):
 
     设计思路：
     - 继承自 Dify 的 OAI 兼容 TTS 基类（OAICompatText2SpeechModel）
-    - 子类仅负责：endpoint 标准化、接口桥接
-    - 实际的音频生成请求由父类完成，复用标准逻辑
+    - 子类负责：endpoint 标准化、接口桥接
+    - 音频格式、分句等逻辑复用父类，请求改由共享的 httpx 客户端发送
     """
 
     def _invoke(
@@ -31,7 +44,7 @@ class INSIGMAAITextToSpeechModel(OAICompatText2SpeechModel):
         content_text: str,
         voice: str,
         user: Optional[str] = None,
-    ) -> Any:
+    ) -> Generator[bytes, None, None]:
         """
         执行文本转语音任务
 
@@ -44,27 +57,113 @@ class INSIGMAAITextToSpeechModel(OAICompatText2SpeechModel):
             user (str, optional): 调用用户 ID（用于审计、日志追踪）
 
         返回:
-            Any: 音频数据流（IO[bytes]）或响应对象，具体由父类决定
+            Generator[bytes, None, None]: 音频数据块
 
         流程:
             1. 清理模型名称（去除首尾空格）
             2. 标准化 endpoint_url（确保以 /v1 结尾）
-            3. 委托父类发送请求并返回音频结果
+            3. 按父类相同的分句与请求格式逐句请求 /v1/audio/speech，流式返回音频
         """
         model = model.strip()
         # 标准化凭证中的 endpoint，确保兼容 OpenAI 风格 API
         standardize_credentials = self._standardize_endpoint_url(credentials)
+        endpoint_url, headers, payloads, timeout = self._build_speech_requests(
+            model, standardize_credentials, content_text, voice
+        )
 
-        # 调用父类实现（发送 POST /v1/audio/speech 请求，返回音频流）
-        return super()._invoke(
-            model=model,
-            tenant_id=tenant_id,
-            credentials=standardize_credentials,
-            content_text=content_text,
-            voice=voice,
-            user=user
+        # 通过进程内共享的 httpx.Client 发送，复用 keep-alive 连接
+        client = get_client()
+        for payload in payloads:
+            with client.stream(
+                "POST", endpoint_url, headers=headers, json=payload, timeout=timeout
+            ) as response:
+                if response.status_code != 200:
+                    response.read()
+                    raise InvokeBadRequestError(response.text)
+                yield from response.iter_bytes(_CHUNK_SIZE)
+
+    async def _ainvoke(
+        self,
+        model: str,
+        tenant_id: str,
+        credentials: dict,
+        content_text: str,
+        voice: str,
+        user: Optional[str] = None,
+        *,
+        client: Optional[httpx.AsyncClient] = None,
+    ) -> AsyncGenerator[bytes, None]:
+        """
+        _invoke 的异步版本，通过 httpx.AsyncClient 流式返回音频数据
+
+        说明：
+        - 当前 dify_plugin 运行时仍同步调用 _invoke；此方法供在事件循环中并发调用的场景使用
+        - 请求由 _build_speech_requests 构造，与 _invoke 完全一致
+        - client 为调用方持有的异步客户端，未传入时本次调用内创建临时客户端，各句请求共用，
+          生成器结束时关闭
+
+        返回:
+            AsyncGenerator[bytes, None]: 音频数据块
+        """
+        model = model.strip()
+        standardize_credentials = self._standardize_endpoint_url(credentials)
+        endpoint_url, headers, payloads, timeout = self._build_speech_requests(
+            model, standardize_credentials, content_text, voice
         )
 
+        async with async_client_scope(client) as http:
+            for payload in payloads:
+                async with http.stream(
+                    "POST", endpoint_url, headers=headers, json=payload, timeout=timeout
+                ) as response:
+                    if response.status_code != 200:
+                        await response.aread()
+                        raise InvokeBadRequestError(response.text)
+                    async for chunk in response.aiter_bytes(_CHUNK_SIZE):
+                        yield chunk
+
+    def _build_speech_requests(
+        self,
+        model: str,
+        credentials: dict,
+        content_text: str,
+        voice: str,
+    ) -> tuple[str, tuple[tuple[str, str], ...], list[dict], httpx.Timeout]:
+        """
+        构造 /v1/audio/speech 请求，_invoke 与 _ainvoke 共用，保证同步与异步请求一致
+
+        说明：
+        - 音频格式、分句字数上限与请求体均与父类实现相同
+        - 超出字数上限的文本按句切分，每句对应一个请求体
+        - 读取超时取自凭证 speech_timeout（默认 300 秒），0 表示不限制，与父类的 requests 调用一致
+
+        参数:
+            model (str): 模型名称
+            credentials (dict): 已标准化的凭证
+            content_text (str): 待合成的文本内容
+            voice (str): 语音角色
+
+        返回:
+            tuple: (请求 URL, 请求头, 各句的请求体列表, 超时设置)
+        """
+        endpoint_url = f"{credentials['endpoint_url']}/audio/speech"
+        headers = auth_headers(credentials.get("api_key"))
+        audio_format = self._get_model_audio_type(model, credentials)
+        word_limit = self._get_model_word_limit(model, credentials)
+
+        payloads = [
+            {
+                "model": model,
+                "input": sentence,
+                "voice": voice,
+                "response_format": audio_format,
+            }
+            for sentence in self._split_text_into_sentences(content_text, word_limit or 2000)
+        ]
+        read_timeout = parse_number(credentials.get("speech_timeout"), float, _DEFAULT_SPEECH_TIMEOUT)
+        timeout = httpx.Timeout(read_timeout if read_timeout > 0 else None, connect=10)
+        return endpoint_url, headers, payloads, timeout
+
     def validate_credentials(self, model: str, credentials: dict, user: Optional[str] = None) -> None:
         """
         验证模型凭证是否有效
@@ -112,24 +211,15 @@ class INSIGMAAITextToSpeechModel(OAICompatText2SpeechModel):
 
         注意:
             - 不修改原始 credentials 对象，避免副作用
-            - 使用字符串操作进行清理，简单高效
+            - 标准化结果按原始 URL 缓存，重复调用只需一次查找
         """
-        # 复制凭证，避免修改原始数据
-        standardize_credentials = credentials.copy()
-
-        # 清理原始 URL：去除末尾斜杠及可能的版本后缀
-        base_url = (
-            credentials["endpoint_url"]
-            .rstrip("/")                  # 去除末尾斜杠
-            .removesuffix("/v1")           # 移除可能的 /v1
-            .removesuffix("/v1/")
-            .removesuffix("/v1-openai")
-            .removesuffix("/v1-openai/")
-            .removesuffix("/openai-v1")
-            .removesuffix("/openai-v1/")
-        )
-
-        # 强制设置为 OpenAI 兼容的标准路径
-        standardize_credentials["endpoint_url"] = f"{base_url}/v1"
+        # 复制凭证并强制设置为 OpenAI 兼容的标准路径
+        # 标准化结果按原始 URL 缓存，避免每次调用重复清理字符串
+        return {**credentials, "endpoint_url": normalize_endpoint(credentials["endpoint_url"])}
 
-        return standardize_credentials
\ No newline at end of file
+    @property
+    def _invoke_error_mapping(self) -> dict[type[InvokeError], list[type[Exception]]]:
+        """
+        异常映射表：在父类（requests 异常）基础上补充 _invoke 使用的 httpx 异常
+        """
+        return with_httpx_errors(super()._invoke_error_mapping)